@@ -3,11 +3,17 @@ FastAPI server implementing OpenAI Chat Completions API with Claude Code backend
 """
 from fastapi import FastAPI, Header, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware, GZipResponder
+from fastapi.responses import Response, StreamingResponse
+import orjson
+import hashlib
+import hmac
 import os
+import time
 import logging
 from contextlib import asynccontextmanager
-from models import ChatCompletionRequest, ChatCompletionResponse, ErrorResponse, ErrorDetail
+from models import ChatCompletionRequest, ChatCompletionResponse, ErrorResponse, ErrorDetail, _new_completion_id
 from claude_wrapper import ClaudeCodeWrapper
 
 # Configure logging
@@ -17,6 +23,56 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+
+class _SSEAwareGZipResponder(GZipResponder):
+    """GZip responder that passes event-stream responses through untouched"""
+
+    def __init__(self, app, minimum_size, compresslevel=9):
+        super().__init__(app, minimum_size, compresslevel=compresslevel)
+        self.passthrough = False
+
+    async def send_with_gzip(self, message) -> None:
+        if self.passthrough:
+            await self.send(message)
+            return
+        if message["type"] == "http.response.start":
+            headers = Headers(raw=message["headers"])
+            if headers.get("content-type", "").startswith("text/event-stream"):
+                self.passthrough = True
+                await self.send(message)
+                return
+        await super().send_with_gzip(message)
+
+
+class SSEAwareGZipMiddleware(GZipMiddleware):
+    """
+    GZipMiddleware that leaves text/event-stream responses uncompressed.
+
+    Starlette's responder feeds streamed chunks through one GzipFile, so
+    small SSE events would sit in the zlib buffer instead of reaching the
+    client as they are produced, defeating token-by-token streaming.
+    """
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] == "http":
+            headers = Headers(scope=scope)
+            if "gzip" in headers.get("Accept-Encoding", ""):
+                responder = _SSEAwareGZipResponder(
+                    self.app, self.minimum_size, compresslevel=self.compresslevel
+                )
+                await responder(scope, receive, send)
+                return
+        await self.app(scope, receive, send)
+
+
+class ORJSONResponse(Response):
+    """JSON response serialized with orjson, bypassing jsonable_encoder"""
+    media_type = "application/json"
+
+    def render(self, content) -> bytes:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+
+
 # Global wrapper instance
 claude_wrapper = None
 
@@ -32,9 +88,10 @@ async def lifespan(app: FastAPI):
     logger.info("Server initialized successfully")
     
     yield
-    
+
     # Shutdown
     logger.info("Shutting down server...")
+    await claude_wrapper.shutdown()
 
 
 # Create FastAPI app
@@ -42,7 +99,8 @@ app = FastAPI(
     title="Claude Code OpenAI API",
     description="OpenAI-compatible API server using Claude Code SDK",
     version="1.0.0",
-    lifespan=lifespan
+    lifespan=lifespan,
+    default_response_class=ORJSONResponse
 )
 
 # Add CORS middleware for browser-based clients
@@ -54,34 +112,30 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-
-@app.get("/")
-async def root():
-    """Root endpoint with API information"""
-    return {
-        "service": "Claude Code OpenAI API",
-        "version": "1.0.0",
-        "endpoints": {
-            "chat_completions": "/v1/chat/completions",
-            "health": "/health",
-            "models": "/v1/models"
-        }
-    }
+# Compress larger JSON responses for clients that accept gzip; SSE
+# streams are excluded so events are not buffered in the compressor
+app.add_middleware(SSEAwareGZipMiddleware, minimum_size=1024, compresslevel=5)
 
 
-@app.get("/health")
-async def health_check():
-    """Health check endpoint"""
-    return {
-        "status": "healthy",
-        "service": "claude-code-openai-api"
+# Static endpoint payloads, serialized once at import time
+_ROOT_JSON = orjson.dumps({
+    "service": "Claude Code OpenAI API",
+    "version": "1.0.0",
+    "endpoints": {
+        "chat_completions": "/v1/chat/completions",
+        "health": "/health",
+        "models": "/v1/models"
     }
+})
 
+_HEALTH_JSON = orjson.dumps({
+    "status": "healthy",
+    "service": "claude-code-openai-api"
+})
 
-@app.get("/v1/models")
-async def list_models():
-    """List available models (OpenAI API compatibility)"""
-    models = [
+_MODELS_JSON = orjson.dumps({
+    "object": "list",
+    "data": [
         {
             "id": "claude-3-5-sonnet-20241022",
             "object": "model",
@@ -104,17 +158,62 @@ async def list_models():
             "owned_by": "claude-proxy"
         }
     ]
-    
-    return {
-        "object": "list",
-        "data": models
+})
+
+_MODELS_ETAG = f'"{hashlib.blake2b(_MODELS_JSON, digest_size=8).hexdigest()}"'
+
+
+@app.get("/")
+async def root():
+    """Root endpoint with API information"""
+    return Response(_ROOT_JSON, media_type="application/json")
+
+
+@app.get("/health")
+async def health_check():
+    """Health check endpoint"""
+    return Response(_HEALTH_JSON, media_type="application/json")
+
+
+@app.get("/v1/models")
+async def list_models(request: Request):
+    """List available models (OpenAI API compatibility)"""
+    # The model list is static, so repeat polls can be answered with 304
+    if request.headers.get("if-none-match") == _MODELS_ETAG:
+        return Response(status_code=304, headers={"ETag": _MODELS_ETAG})
+    return Response(
+        _MODELS_JSON,
+        media_type="application/json",
+        headers={"ETag": _MODELS_ETAG}
+    )
+
+
+async def _sse_stream(model: str, chunks):
+    """Wrap Claude response chunks as OpenAI-format SSE events"""
+    base = {
+        "id": _new_completion_id(),
+        "object": "chat.completion.chunk",
+        "created": time.time_ns() // 1_000_000_000,
+        "model": model,
     }
 
+    # Initial chunk carrying the assistant role
+    first = dict(base, choices=[{"index": 0, "delta": {"role": "assistant"}, "finish_reason": None}])
+    yield b"data: " + orjson.dumps(first) + b"\n\n"
+
+    async for chunk in chunks:
+        payload = dict(base, choices=[{"index": 0, "delta": {"content": chunk}, "finish_reason": None}])
+        yield b"data: " + orjson.dumps(payload) + b"\n\n"
+
+    final = dict(base, choices=[{"index": 0, "delta": {}, "finish_reason": "stop"}])
+    yield b"data: " + orjson.dumps(final) + b"\n\n"
+    yield b"data: [DONE]\n\n"
+
 
 @app.post("/v1/chat/completions")
 async def chat_completions(
     request: ChatCompletionRequest,
-    authorization: str = Header(None, regex="^Bearer .+")
+    authorization: str = Header(None)
 ):
     """
     Main endpoint implementing OpenAI Chat Completions API
@@ -123,18 +222,23 @@ async def chat_completions(
         # Validate authorization (optional)
         api_key = None
         if authorization:
-            api_key = authorization.replace("Bearer ", "")
-        
-        # Check API key if configured
+            if not authorization.startswith("Bearer "):
+                raise HTTPException(
+                    status_code=401,
+                    detail="Invalid authorization header"
+                )
+            api_key = authorization[7:]
+
+        # Check API key if configured (constant-time compare)
         expected_key = os.getenv("API_KEY")
-        if expected_key and api_key != expected_key:
+        if expected_key and not hmac.compare_digest(api_key or "", expected_key):
             raise HTTPException(
                 status_code=401,
                 detail="Invalid API key"
             )
         
         # Log request
-        logger.info(f"Processing chat completion request - Model: {request.model}, Messages: {len(request.messages)}")
+        logger.info("Processing chat completion request - Model: %s, Messages: %d", request.model, len(request.messages))
         
         # Validate request
         if request.n != 1:
@@ -144,21 +248,24 @@ async def chat_completions(
             )
         
         if request.stream:
-            raise HTTPException(
-                status_code=400,
-                detail="Streaming is not yet supported"
+            # Validate the request and check out a client before committing
+            # to a 200, then stream chunks as they arrive from Claude
+            chunks = await claude_wrapper.stream_request(request)
+            return StreamingResponse(
+                _sse_stream(request.model, chunks),
+                media_type="text/event-stream"
             )
-        
+
         # Process with Claude
         response = await claude_wrapper.process_request(request)
         
-        logger.info(f"Request completed successfully - Tokens: {response.usage.total_tokens}")
-        return response
+        logger.info("Request completed successfully - Tokens: %d", response.usage.total_tokens)
+        return ORJSONResponse(response.model_dump(mode="json"))
         
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Error processing request: {str(e)}", exc_info=True)
+        logger.error("Error processing request: %s", e, exc_info=True)
         
         # Create error response
         error = ErrorDetail(
@@ -167,7 +274,7 @@ async def chat_completions(
             code="internal_server_error"
         )
         
-        return JSONResponse(
+        return ORJSONResponse(
             status_code=500,
             content=ErrorResponse(error=error).model_dump()
         )
@@ -182,7 +289,7 @@ async def http_exception_handler(request: Request, exc: HTTPException):
         code=str(exc.status_code)
     )
     
-    return JSONResponse(
+    return ORJSONResponse(
         status_code=exc.status_code,
         content=ErrorResponse(error=error).model_dump()
     )
@@ -190,6 +297,31 @@ async def http_exception_handler(request: Request, exc: HTTPException):
 
 if __name__ == "__main__":
     import uvicorn
-    
+
+    # Prefer the uvloop event loop and httptools parser (bundled with
+    # uvicorn[standard]); fall back to asyncio/h11 where unavailable
+    try:
+        import uvloop  # noqa: F401
+        loop = "uvloop"
+    except ImportError:
+        loop = "auto"
+    try:
+        import httptools  # noqa: F401
+        http = "httptools"
+    except ImportError:
+        http = "auto"
+
     port = int(os.getenv("PORT", "8000"))
-    uvicorn.run(app, host="0.0.0.0", port=port, log_level="info")
\ No newline at end of file
+    workers = int(os.getenv("WORKERS", str(os.cpu_count() or 1)))
+    uvicorn.run(
+        # Pass the import string so uvicorn can fork multiple workers
+        "app:app",
+        host="0.0.0.0",
+        port=port,
+        workers=workers,
+        loop=loop,
+        http=http,
+        backlog=2048,
+        timeout_keep_alive=30,
+        log_level="info"
+    )
\ No newline at end of file
@@ -3,22 +3,86 @@ Claude Code SDK wrapper for OpenAI API compatibility
 """
 import os
 from claude_code_sdk import ClaudeSDKClient, ClaudeCodeOptions
+
+try:
+    from claude_code_sdk import ErrorMessage
+except ImportError:
+    # SDK versions without ErrorMessage: placeholder that matches nothing
+    class ErrorMessage:
+        pass
+
 from models import (
     ChatCompletionRequest, ChatCompletionResponse, 
     Message, Choice, Usage
 )
 from json_formatter import ensure_json_response, create_json_instruction
+from llm_cache import LLMCache
+import functools
+import hashlib
 import json
 import logging
 import asyncio
-from typing import Optional, List, Dict, Any
+import types
+import uuid
+from typing import AsyncIterator, Optional, List, Dict, Any
+
+import orjson
 
 logger = logging.getLogger(__name__)
 
 # Set CLAUDE_CODE_PATH environment variable if provided
 if claude_path := os.getenv("CLAUDE_CODE_PATH"):
     os.environ["CLAUDE_CODE_PATH"] = claude_path
-    logger.info(f"Using Claude CLI at: {claude_path}")
+    logger.info("Using Claude CLI at: %s", claude_path)
+
+# Map OpenAI-style model names to Claude models (frozen, shared across instances)
+_MODEL_MAP = types.MappingProxyType({
+    "gpt-4": "claude-3-5-sonnet-20241022",
+    "gpt-4-turbo": "claude-3-5-sonnet-20241022",
+    "gpt-3.5-turbo": "claude-3-5-haiku-20241022",
+    "claude-3-5-sonnet": "claude-3-5-sonnet-20241022",
+    "claude-3-5-haiku": "claude-3-5-haiku-20241022",
+    "claude-3-5-sonnet-20241022": "claude-3-5-sonnet-20241022",
+    "claude-3-5-haiku-20241022": "claude-3-5-haiku-20241022",
+})
+
+
+@functools.lru_cache(maxsize=128)
+def _options_dict(model: str, system_prompt: Optional[str], json_mode: bool) -> dict:
+    """
+    Build (and memoize) the ClaudeCodeOptions kwargs for a request shape.
+
+    Repeated requests with the same model/system prompt/response format
+    reuse the cached dict instead of rebuilding it.
+    """
+    options_dict = {
+        "model": model,
+        "max_turns": 1,  # Single turn for API compatibility
+        "permission_mode": "bypassPermissions",  # No interactive prompts
+        "max_thinking_tokens": 8000,
+        # Configure allowed tools (you can customize this based on your needs)
+        # Available tools: Bash, Read, Write, Edit, Grep, Glob, LS, WebSearch, etc.
+        "allowed_tools": ["Read", "Grep", "Glob", "LS"],
+    }
+
+    # Add system prompt
+    if system_prompt:
+        options_dict["system_prompt"] = system_prompt
+
+    # Add JSON instruction if needed
+    if json_mode:
+        json_instruction = create_json_instruction()
+        if system_prompt:
+            options_dict["append_system_prompt"] = json_instruction
+        else:
+            options_dict["system_prompt"] = json_instruction
+
+    return options_dict
+
+
+def _approx_tokens(text: str) -> int:
+    """Approximate token count (~4 chars/token for English text)"""
+    return (len(text) + 3) // 4
 
 
 class ClaudeCodeWrapper:
@@ -28,16 +92,16 @@ class ClaudeCodeWrapper:
     
     def __init__(self, default_model: str = "claude-3-5-sonnet-20241022"):
         self.default_model = default_model
-        self.model_mapping = {
-            # Map OpenAI-style model names to Claude models
-            "gpt-4": "claude-3-5-sonnet-20241022",
-            "gpt-4-turbo": "claude-3-5-sonnet-20241022",
-            "gpt-3.5-turbo": "claude-3-5-haiku-20241022",
-            "claude-3-5-sonnet": "claude-3-5-sonnet-20241022",
-            "claude-3-5-haiku": "claude-3-5-haiku-20241022",
-            "claude-3-5-sonnet-20241022": "claude-3-5-sonnet-20241022",
-            "claude-3-5-haiku-20241022": "claude-3-5-haiku-20241022",
-        }
+        # Response cache for deterministic (temperature=0) requests
+        self.cache = LLMCache()
+        # Warm SDK clients keyed by options fingerprint, checked out per
+        # request. Bounded: unique system prompts produce unique
+        # fingerprints, which must not pin subprocesses forever
+        self._pool: Dict[str, asyncio.Queue] = {}
+        self._pool_clients_per_key = int(os.getenv("CLIENT_POOL_SIZE", "2"))
+        self._pool_max_keys = int(os.getenv("CLIENT_POOL_KEYS", "8"))
+        # In-flight Claude calls keyed by cache key, for request coalescing
+        self._inflight: Dict[str, asyncio.Task] = {}
     
     async def process_request(self, request: ChatCompletionRequest) -> ChatCompletionResponse:
         """
@@ -51,67 +115,199 @@ class ClaudeCodeWrapper:
         """
         try:
             # Extract messages
-            system_prompt = self._extract_system_prompt(request.messages)
-            user_message = self._extract_user_message(request.messages)
-            
+            system_prompt, user_message = self._extract_messages(request.messages)
+
+            # Check the cache for deterministic requests
+            cache_key = None
+            if self.cache.enabled and request.temperature == 0:
+                cache_key = LLMCache.make_key(
+                    model=_MODEL_MAP.get(request.model, request.model),
+                    system_prompt=system_prompt,
+                    user_message=user_message,
+                    response_format=request.response_format.type if request.response_format else None
+                )
+                cached = await self.cache.get(cache_key)
+                if cached is not None:
+                    logger.info("LLM cache hit (hits=%d, misses=%d)", self.cache.hits, self.cache.misses)
+                    return self._create_response(cached["content"], request)
+
+                # Coalesce with an identical request already in flight;
+                # shield so cancelling this waiter can't kill the shared call
+                inflight = self._inflight.get(cache_key)
+                if inflight is not None:
+                    logger.info("Joining in-flight Claude call for identical request")
+                    return self._create_response(await asyncio.shield(inflight), request)
+
             # Configure Claude options
             options = self._create_claude_options(request, system_prompt)
-            
+
             # Process with Claude
-            response_text = await self._call_claude(user_message, options, request)
-            
+            try:
+                if cache_key is not None:
+                    # Register the call so concurrent identical requests await
+                    # it; the shared task outlives any one waiter (shielded),
+                    # and deregisters itself once it completes
+                    task = asyncio.ensure_future(self._call_claude(user_message, options, request))
+                    self._inflight[cache_key] = task
+                    task.add_done_callback(lambda _t: self._inflight.pop(cache_key, None))
+                    response_text = await asyncio.shield(task)
+                else:
+                    response_text = await self._call_claude(user_message, options, request)
+            except Exception as e:
+                # Surface the failure as a JSON body if JSON mode is requested,
+                # but never cache it - the next identical request should retry
+                if request.response_format and request.response_format.type == "json_object":
+                    return self._create_response(json.dumps({"error": str(e)}), request)
+                raise
+
+            # Store successful completions for future identical requests
+            if cache_key is not None:
+                await self.cache.set(cache_key, {"content": response_text})
+
             # Create OpenAI-format response
             return self._create_response(response_text, request)
-            
+
         except Exception as e:
-            logger.error(f"Error processing request: {str(e)}", exc_info=True)
+            logger.error("Error processing request: %s", e, exc_info=True)
             raise
+
+    async def stream_request(self, request: ChatCompletionRequest) -> AsyncIterator[str]:
+        """
+        Process a streaming chat completion request, returning an iterator of
+        response text chunks as they arrive from Claude instead of buffering
+        the full completion.
+
+        Validation happens here, before any chunk is produced, so a bad
+        request fails with an error status rather than dying mid-stream
+        after a 200. The client is checked out inside the generator once
+        streaming actually starts, so a handler cancelled before the first
+        iteration holds no client to leak.
+
+        Args:
+            request: OpenAI ChatCompletionRequest with stream=True
+
+        Returns:
+            Async iterator of response text chunks
+        """
+        system_prompt, user_message = self._extract_messages(request.messages)
+        options = self._create_claude_options(request, system_prompt)
+        return self._stream_claude(user_message, options)
+
+    async def _stream_claude(self, message: str, options: ClaudeCodeOptions) -> AsyncIterator[str]:
+        """Yield response text chunks from a pooled client"""
+        fingerprint, client = await self._acquire_client(options)
+        try:
+            # Fresh session per request (see _call_claude)
+            await client.query(message, session_id=uuid.uuid4().hex)
+
+            async for msg in client.receive_response():
+                content = getattr(msg, 'content', None)
+                if content:
+                    for block in content:
+                        if hasattr(block, 'text'):
+                            yield block.text
+
+                # Log any errors
+                if isinstance(msg, ErrorMessage):
+                    logger.error("Claude error: %s", msg)
+
+        except BaseException as e:
+            # BaseException also covers the GeneratorExit thrown when the
+            # consumer disconnects mid-stream; either way the session is in
+            # an unknown state, so close the client instead of pooling it
+            await self._discard_client(client)
+            if isinstance(e, Exception):
+                logger.error("Error streaming from Claude: %s", e, exc_info=True)
+            raise
+        else:
+            await self._release_client(fingerprint, client)
     
-    def _extract_system_prompt(self, messages: List[Message]) -> Optional[str]:
-        """Extract system prompt from messages"""
-        system_messages = [msg.content for msg in messages if msg.role == "system"]
-        return "\n".join(system_messages) if system_messages else None
-    
-    def _extract_user_message(self, messages: List[Message]) -> str:
-        """Extract the latest user message"""
-        user_messages = [msg for msg in messages if msg.role == "user"]
-        if not user_messages:
+    def _extract_messages(self, messages: List[Message]) -> tuple:
+        """
+        Extract the system prompt and latest user message in one pass.
+
+        Returns:
+            Tuple of (system_prompt or None, last user message content)
+        """
+        system_parts = []
+        last_user = None
+        for msg in messages:
+            role = msg.role
+            if role == "system":
+                system_parts.append(msg.content)
+            elif role == "user":
+                # Keep only the last user message (single-turn support only)
+                last_user = msg.content
+
+        if last_user is None:
             raise ValueError("No user message found in request")
-        
-        # Return the last user message (single-turn support only)
-        return user_messages[-1].content
+
+        return ("\n".join(system_parts) if system_parts else None, last_user)
     
     def _create_claude_options(self, request: ChatCompletionRequest, system_prompt: Optional[str]) -> ClaudeCodeOptions:
         """Create ClaudeCodeOptions from the request"""
         # Map model name
-        model = self.model_mapping.get(request.model, request.model)
-        
-        # Build options
-        options_dict = {
-            "model": model,
-            "max_turns": 1,  # Single turn for API compatibility
-            "permission_mode": "bypassPermissions",  # No interactive prompts
-            "max_thinking_tokens": 8000,
-        }
-        
-        # Add system prompt
-        if system_prompt:
-            options_dict["system_prompt"] = system_prompt
-        
-        # Add JSON instruction if needed
-        if request.response_format and request.response_format.type == "json_object":
-            json_instruction = create_json_instruction()
-            if system_prompt:
-                options_dict["append_system_prompt"] = json_instruction
-            else:
-                options_dict["system_prompt"] = json_instruction
-        
-        # Configure allowed tools (you can customize this based on your needs)
-        # Available tools: Bash, Read, Write, Edit, Grep, Glob, LS, WebSearch, etc.
-        options_dict["allowed_tools"] = ["Read", "Grep", "Glob", "LS"]
-        
-        return ClaudeCodeOptions(**options_dict)
-    
+        model = _MODEL_MAP.get(request.model, request.model)
+
+        json_mode = bool(request.response_format and request.response_format.type == "json_object")
+        return ClaudeCodeOptions(**_options_dict(model, system_prompt, json_mode))
+
+    @staticmethod
+    def _options_fingerprint(options: ClaudeCodeOptions) -> str:
+        """Stable pool key for a set of Claude options"""
+        serialized = orjson.dumps(vars(options), option=orjson.OPT_SORT_KEYS, default=str)
+        return hashlib.blake2b(serialized, digest_size=8).hexdigest()
+
+    async def _acquire_client(self, options: ClaudeCodeOptions) -> tuple:
+        """
+        Check out a warm client for these options, connecting a new one if
+        the pool is empty.
+
+        Returns:
+            Tuple of (fingerprint, connected ClaudeSDKClient)
+        """
+        fingerprint = self._options_fingerprint(options)
+        queue = self._pool.get(fingerprint)
+        if queue is None:
+            # Evict the least recently added fingerprints at capacity so the
+            # pool can't grow one subprocess per distinct system prompt
+            while len(self._pool) >= self._pool_max_keys:
+                oldest = next(iter(self._pool))
+                old_queue = self._pool.pop(oldest)
+                while not old_queue.empty():
+                    await self._discard_client(old_queue.get_nowait())
+            queue = asyncio.Queue()
+            self._pool[fingerprint] = queue
+        try:
+            client = queue.get_nowait()
+        except asyncio.QueueEmpty:
+            client = ClaudeSDKClient(options=options)
+            await client.__aenter__()
+        return fingerprint, client
+
+    async def _release_client(self, fingerprint: str, client: ClaudeSDKClient) -> None:
+        """Return a healthy client to the pool, or close it when the pool is full"""
+        queue = self._pool.get(fingerprint)
+        if queue is None or queue.qsize() >= self._pool_clients_per_key:
+            # Fingerprint evicted while checked out, or enough idle clients
+            await self._discard_client(client)
+        else:
+            queue.put_nowait(client)
+
+    async def _discard_client(self, client: ClaudeSDKClient) -> None:
+        """Close a client whose session may be broken instead of pooling it"""
+        try:
+            await client.__aexit__(None, None, None)
+        except Exception as e:
+            logger.warning("Error closing Claude client: %s", e)
+
+    async def shutdown(self) -> None:
+        """Close all pooled clients (called from the server lifespan)"""
+        for queue in self._pool.values():
+            while not queue.empty():
+                await self._discard_client(queue.get_nowait())
+        self._pool.clear()
+
     async def _call_claude(self, message: str, options: ClaudeCodeOptions, request: ChatCompletionRequest) -> str:
         """
         Call Claude Code SDK and collect the response.
@@ -125,30 +321,32 @@ class ClaudeCodeWrapper:
             Response text from Claude
         """
         full_response = []
-        
+
+        fingerprint, client = await self._acquire_client(options)
         try:
-            async with ClaudeSDKClient(options=options) as client:
-                # Send the query
-                await client.query(message)
-                
-                # Collect response
-                async for msg in client.receive_response():
-                    if hasattr(msg, 'content'):
-                        for block in msg.content:
-                            if hasattr(block, 'text'):
-                                full_response.append(block.text)
-                    
-                    # Log any errors
-                    if type(msg).__name__ == "ErrorMessage":
-                        logger.error(f"Claude error: {msg}")
-                
+            # Send the query in a fresh session: pooled clients share a CLI
+            # process, but each request must not see another's conversation
+            await client.query(message, session_id=uuid.uuid4().hex)
+
+            # Collect response
+            async for msg in client.receive_response():
+                content = getattr(msg, 'content', None)
+                if content:
+                    for block in content:
+                        if hasattr(block, 'text'):
+                            full_response.append(block.text)
+
+                # Log any errors
+                if isinstance(msg, ErrorMessage):
+                    logger.error("Claude error: %s", msg)
+
         except Exception as e:
-            logger.error(f"Error calling Claude: {str(e)}")
-            # Return error as JSON if JSON mode is requested
-            if request.response_format and request.response_format.type == "json_object":
-                return json.dumps({"error": str(e)})
-            else:
-                raise
+            # The session may be in a bad state, so close it instead of pooling
+            await self._discard_client(client)
+            logger.error("Error calling Claude: %s", e)
+            raise
+        else:
+            await self._release_client(fingerprint, client)
         
         response_text = ''.join(full_response)
         
@@ -160,28 +358,30 @@ class ClaudeCodeWrapper:
     
     def _create_response(self, content: str, request: ChatCompletionRequest) -> ChatCompletionResponse:
         """Create OpenAI-format response"""
-        # Create assistant message
-        assistant_message = Message(role="assistant", content=content)
-        
+        # All values below are server-produced and known valid, so use
+        # model_construct to skip redundant pydantic validation
+        assistant_message = Message.model_construct(role="assistant", content=content)
+
         # Create choice
-        choice = Choice(
+        choice = Choice.model_construct(
             index=0,
             message=assistant_message,
             finish_reason="stop"
         )
-        
+
         # Estimate token usage (rough approximation)
         # Real implementation would use proper tokenization
-        prompt_tokens = sum(len(msg.content.split()) for msg in request.messages) * 1.3
-        completion_tokens = len(content.split()) * 1.3
-        
-        usage = Usage(
-            prompt_tokens=int(prompt_tokens),
-            completion_tokens=int(completion_tokens),
-            total_tokens=int(prompt_tokens + completion_tokens)
+        prompt_tokens = sum(_approx_tokens(msg.content) for msg in request.messages)
+        completion_tokens = _approx_tokens(content)
+
+        usage = Usage.model_construct(
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            total_tokens=prompt_tokens + completion_tokens
         )
-        
-        return ChatCompletionResponse(
+
+        # model_construct still applies field defaults (id, created, ...)
+        return ChatCompletionResponse.model_construct(
             model=request.model,
             choices=[choice],
             usage=usage
@@ -1,4 +1,4 @@
 #!/bin/bash
 
 # Start the application directly
-exec python -m uvicorn app:app --host 0.0.0.0 --port 8000
\ No newline at end of file
+exec python -m uvicorn app:app --host 0.0.0.0 --port 8000 --workers "${WORKERS:-1}"
@@ -1,12 +1,60 @@
 """
 JSON formatting utilities for ensuring Claude responses are valid JSON
 """
-import json
 import re
 import logging
 
+import orjson
+
 logger = logging.getLogger(__name__)
 
+# Patterns compiled once at import time.
+# Markdown code blocks: ```json blocks first, then generic ``` blocks
+_MD_JSON_BLOCK_RE = re.compile(r'```json\s*\n?([\s\S]*?)\n?```', re.MULTILINE)
+_MD_ANY_BLOCK_RE = re.compile(r'```\s*\n?([\s\S]*?)\n?```', re.MULTILINE)
+_OPEN_TO_CLOSE = {"{": "}", "[": "]"}
+
+_BASE_JSON_INSTRUCTION = """
+You must respond with valid JSON only. Do not include any explanations, markdown formatting, or text outside the JSON.
+Your entire response must be parseable by JSON.parse().
+"""
+
+
+def _find_json_spans(text: str):
+    """
+    Return (start, end) spans of balanced {...} / [...] regions in text,
+    outer spans ordered before the spans nested inside them.
+
+    True single pass, string/escape-aware: opener positions go on a stack
+    and a span is emitted whenever a closer matches the stack top. Inner
+    spans are still found when an outer span is unbalanced (e.g. truncated
+    output) or rejected by the caller, in O(n + spans) with no rescanning.
+    """
+    spans = []
+    stack = []  # (opener char, start index)
+    in_string = False
+    n = len(text)
+    i = 0
+    while i < n:
+        c = text[i]
+        if in_string:
+            if c == "\\":
+                i += 1  # skip the escaped character
+            elif c == '"':
+                in_string = False
+        elif c == '"':
+            in_string = True
+        elif c in _OPEN_TO_CLOSE:
+            stack.append((c, i))
+        elif stack and c == _OPEN_TO_CLOSE[stack[-1][0]]:
+            _, start = stack.pop()
+            spans.append((start, i + 1))
+        i += 1
+
+    # Prefer outermost candidates: earliest start, then longest
+    spans.sort(key=lambda span: (span[0], -span[1]))
+    return spans
+
 
 def extract_json_from_text(text: str) -> str:
     """
@@ -18,51 +66,46 @@ def extract_json_from_text(text: str) -> str:
     Returns:
         Valid JSON string
     """
-    # First, try to parse the entire text as JSON
-    try:
-        json.loads(text)
-        return text
-    except json.JSONDecodeError:
-        pass
-    
+    # First, try to parse the entire text as JSON - but only if it can
+    # plausibly be JSON: an object, array, string, number, or true/false/null.
+    # Most prose fails this single char check without paying for a parse.
+    head = text.lstrip()[:1]
+    if head and head in '{["-0123456789tfn':
+        try:
+            orjson.loads(text)
+            return text
+        except orjson.JSONDecodeError:
+            pass
+
     # Try to extract JSON from markdown code blocks
-    # Look for ```json blocks first, then generic ``` blocks
-    patterns = [
-        r'```json\s*\n?([\s\S]*?)\n?```',
-        r'```\s*\n?([\s\S]*?)\n?```',
-    ]
-    
-    for pattern in patterns:
-        matches = re.findall(pattern, text, re.MULTILINE)
-        for match in matches:
-            try:
-                # Validate it's proper JSON
-                json.loads(match.strip())
-                return match.strip()
-            except json.JSONDecodeError:
-                continue
-    
+    if "```" in text:
+        for pattern in (_MD_JSON_BLOCK_RE, _MD_ANY_BLOCK_RE):
+            for match in pattern.finditer(text):
+                candidate = match.group(1).strip()
+                try:
+                    # Validate it's proper JSON
+                    orjson.loads(candidate)
+                    return candidate
+                except orjson.JSONDecodeError:
+                    continue
+
     # Try to find raw JSON objects or arrays
-    # Look for content between outermost { } or [ ]
-    json_object_pattern = r'\{(?:[^{}]|(?:\{(?:[^{}]|(?:\{[^{}]*\})*)*\})*)*\}'
-    json_array_pattern = r'\[(?:[^\[\]]|(?:\[(?:[^\[\]]|(?:\[[^\[\]]*\])*)*\])*)*\]'
-    
-    for pattern in [json_object_pattern, json_array_pattern]:
-        matches = re.findall(pattern, text, re.DOTALL)
-        for match in matches:
+    if "{" in text or "[" in text:
+        for start, end in _find_json_spans(text):
+            candidate = text[start:end]
             try:
                 # Validate it's proper JSON
-                json.loads(match)
-                return match
-            except json.JSONDecodeError:
+                orjson.loads(candidate)
+                return candidate
+            except orjson.JSONDecodeError:
                 continue
-    
+
     # If we still can't find valid JSON, create a JSON object from the text
-    logger.warning(f"Could not extract valid JSON from response, wrapping in object")
-    return json.dumps({
+    logger.warning("Could not extract valid JSON from response, wrapping in object")
+    return orjson.dumps({
         "response": text,
         "_note": "Original response was not valid JSON"
-    }, ensure_ascii=False)
+    }).decode()
 
 
 def ensure_json_response(text: str, schema: dict = None) -> str:
@@ -82,7 +125,7 @@ def ensure_json_response(text: str, schema: dict = None) -> str:
     # try to restructure it
     if schema and "_graphiti_schema" in str(schema):
         try:
-            data = json.loads(json_str)
+            data = orjson.loads(json_str)
             # Check if response is wrapped in our fallback format
             if "_note" in data and "response" in data:
                 # Try to extract structured data from the response text
@@ -105,12 +148,7 @@ def create_json_instruction(schema: dict = None) -> str:
     Returns:
         Instruction text
     """
-    base_instruction = """
-You must respond with valid JSON only. Do not include any explanations, markdown formatting, or text outside the JSON.
-Your entire response must be parseable by JSON.parse().
-"""
-    
     if schema:
-        base_instruction += f"\nThe JSON should conform to this structure: {json.dumps(schema, indent=2)}"
-    
-    return base_instruction
\ No newline at end of file
+        return _BASE_JSON_INSTRUCTION + f"\nThe JSON should conform to this structure: {orjson.dumps(schema, option=orjson.OPT_INDENT_2).decode()}"
+
+    return _BASE_JSON_INSTRUCTION
\ No newline at end of file
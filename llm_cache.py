@@ -0,0 +1,133 @@
+"""
+In-process and shared LRU caches for deterministic LLM responses
+"""
+import hashlib
+import os
+import logging
+from collections import OrderedDict
+from typing import Optional, Dict, Any
+
+import orjson
+
+logger = logging.getLogger(__name__)
+
+# Default number of cached responses; set LLM_CACHE_SIZE=0 to disable
+DEFAULT_CACHE_SIZE = 256
+
+# Default TTL for shared (Redis) cache entries, in seconds
+DEFAULT_CACHE_TTL = 3600
+
+
+class MemoryBackend:
+    """Per-process OrderedDict LRU backend"""
+
+    def __init__(self, max_size: int):
+        self.max_size = max_size
+        self._entries: OrderedDict[str, Dict[str, Any]] = OrderedDict()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        # Refresh LRU position
+        self._entries.move_to_end(key)
+        return entry
+
+    async def set(self, key: str, entry: Dict[str, Any]) -> None:
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    async def clear(self) -> None:
+        self._entries.clear()
+
+
+class RedisBackend:
+    """
+    Redis-backed cache shared across worker processes, so a hit in one
+    worker serves identical requests in all of them.
+    """
+
+    def __init__(self, url: str, ttl: Optional[int] = None):
+        import redis.asyncio as redis  # Optional dependency
+
+        if ttl is None:
+            ttl = int(os.getenv("LLM_CACHE_TTL", str(DEFAULT_CACHE_TTL)))
+        self.ttl = ttl
+        self._redis = redis.from_url(url)
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        raw = await self._redis.get(f"llm-cache:{key}")
+        return orjson.loads(raw) if raw is not None else None
+
+    async def set(self, key: str, entry: Dict[str, Any]) -> None:
+        await self._redis.set(f"llm-cache:{key}", orjson.dumps(entry), ex=self.ttl)
+
+    async def clear(self) -> None:
+        await self._redis.flushdb()
+
+
+class LLMCache:
+    """
+    Exact-key cache for Claude responses.
+
+    Identical deterministic (temperature=0) requests are served from the
+    cache instead of making another SDK round-trip. Keys are content hashes
+    of the request fields that affect the response. The backend is chosen
+    via CACHE_BACKEND: "memory" (default, per-process LRU) or "redis"
+    (shared across workers, connection from REDIS_URL).
+    """
+
+    def __init__(self, max_size: Optional[int] = None, backend: Optional[str] = None):
+        if max_size is None:
+            max_size = int(os.getenv("LLM_CACHE_SIZE", str(DEFAULT_CACHE_SIZE)))
+        if backend is None:
+            backend = os.getenv("CACHE_BACKEND", "memory")
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+
+        if backend == "redis":
+            self._backend = RedisBackend(os.getenv("REDIS_URL", "redis://localhost:6379/0"))
+        else:
+            self._backend = MemoryBackend(max_size)
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    @staticmethod
+    def make_key(
+        model: str,
+        system_prompt: Optional[str],
+        user_message: str,
+        response_format: Optional[str]
+    ) -> str:
+        """Build a stable cache key from the response-relevant request fields"""
+        payload = {
+            "model": model,
+            "system_prompt": system_prompt,
+            "user_message": user_message,
+            "response_format": response_format,
+        }
+        serialized = orjson.dumps(payload, option=orjson.OPT_SORT_KEYS)
+        return hashlib.blake2b(serialized).hexdigest()
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        """Return the cached entry for key, or None on a miss"""
+        entry = await self._backend.get(key)
+        if entry is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return entry
+
+    async def set(self, key: str, entry: Dict[str, Any]) -> None:
+        """Store an entry for future identical requests"""
+        if not self.enabled:
+            return
+        await self._backend.set(key, entry)
+
+    async def clear(self) -> None:
+        await self._backend.clear()
@@ -2,13 +2,28 @@
 Pydantic models for OpenAI Chat Completion API compatibility
 """
 from typing import List, Optional, Dict, Any, Literal
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
+import os
 import time
 import uuid
 
+# Entropy pool for completion ids: one os.urandom syscall per 256 ids
+_ID_POOL = bytearray()
+
+
+def _new_completion_id() -> str:
+    """Generate a chatcmpl id, drawing 16 bytes from the batched pool"""
+    if not _ID_POOL:
+        _ID_POOL.extend(os.urandom(4096))
+    raw = bytes(_ID_POOL[-16:])
+    del _ID_POOL[-16:]
+    return f"chatcmpl-{uuid.UUID(bytes=raw, version=4)}"
+
 
 class Message(BaseModel):
     """OpenAI message format"""
+    model_config = ConfigDict(frozen=True)
+
     role: Literal["system", "user", "assistant"]
     content: str
 
@@ -27,13 +42,14 @@ class ChatCompletionRequest(BaseModel):
     response_format: Optional[ResponseFormat] = None
     stream: Optional[bool] = False
     n: Optional[int] = Field(default=1, ge=1, le=1)  # We only support n=1
-    
-    class Config:
-        extra = "allow"  # Allow additional OpenAI parameters we don't use
+
+    model_config = ConfigDict(extra="allow", frozen=True)  # Allow additional OpenAI parameters we don't use
 
 
 class Choice(BaseModel):
     """Response choice"""
+    model_config = ConfigDict(frozen=True)
+
     index: int = 0
     message: Message
     finish_reason: Literal["stop", "length", "content_filter"] = "stop"
@@ -41,6 +57,8 @@ class Choice(BaseModel):
 
 class Usage(BaseModel):
     """Token usage information"""
+    model_config = ConfigDict(frozen=True)
+
     prompt_tokens: int = 0
     completion_tokens: int = 0
     total_tokens: int = 0
@@ -48,9 +66,10 @@ class Usage(BaseModel):
 
 class ChatCompletionResponse(BaseModel):
     """OpenAI Chat Completion API response format"""
-    id: str = Field(default_factory=lambda: f"chatcmpl-{uuid.uuid4()}")
+    id: str = Field(default_factory=_new_completion_id)
     object: Literal["chat.completion"] = "chat.completion"
-    created: int = Field(default_factory=lambda: int(time.time()))
+    # time_ns avoids the float round-trip of time.time()
+    created: int = Field(default_factory=lambda: time.time_ns() // 1_000_000_000)
     model: str
     choices: List[Choice]
     usage: Usage = Field(default_factory=Usage)